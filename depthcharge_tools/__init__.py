@@ -6,9 +6,10 @@
 # See COPYRIGHT and LICENSE files for full copyright information.
 
 import glob
+import importlib.metadata
+import importlib.resources
 import logging
 import pathlib
-import pkg_resources
 import re
 import subprocess
 
@@ -18,14 +19,12 @@ logger.addHandler(logging.NullHandler())
 
 def get_version():
     version = None
-    pkg_path = pkg_resources.resource_filename(__name__, '')
-    pkg_path = pathlib.Path(pkg_path).resolve()
+    pkg_path = pathlib.Path(__file__).parent.resolve()
 
     try:
-        self = pkg_resources.require(__name__)[0]
-        version = self.version
+        version = importlib.metadata.version(__name__)
 
-    except pkg_resources.DistributionNotFound:
+    except importlib.metadata.PackageNotFoundError:
         setup_py = pkg_path.parent / "setup.py"
         if setup_py.exists():
             version = re.findall(
@@ -48,16 +47,20 @@ def get_version():
             else:
                 version = tag
 
-    if version is not None:
-        return pkg_resources.parse_version(version)
+            # Importing pkg_resources is slow, and only git describe
+            # output needs to be normalized.
+            import pkg_resources
+            version = pkg_resources.parse_version(version)
+
+    return version
 
 __version__ = get_version()
 
-config_ini = pkg_resources.resource_string(__name__, "config.ini")
-config_ini = config_ini.decode("utf-8")
+config_ini = importlib.resources.files(__name__).joinpath("config.ini")
+config_ini = config_ini.read_bytes().decode("utf-8")
 
-boards_ini = pkg_resources.resource_string(__name__, "boards.ini")
-boards_ini = boards_ini.decode("utf-8")
+boards_ini = importlib.resources.files(__name__).joinpath("boards.ini")
+boards_ini = boards_ini.read_bytes().decode("utf-8")
 
 config_files = [
     *glob.glob("/etc/depthcharge-tools/config"),
@@ -12,11 +12,13 @@ import copy
 import glob
 import logging
 import os
+import pickle
 import platform
 import re
 import shlex
 import tempfile
 
+from functools import cached_property, lru_cache
 from pathlib import Path
 
 from depthcharge_tools import (
@@ -52,36 +54,51 @@ from depthcharge_tools.utils.string import (
 )
 
 
+# Resolved once, as it's compared against in most path checks.
+_system_root = Path("/").resolve()
+
+# Used to detect and split plain dt-compatible strings in board configs.
+_dt_simple_re = re.compile(r"[\w,-]+")
+_dt_split_re = re.compile(r"(.*?)(-rev\d+)?(-sku\d+)?")
+
+# Characters that could make shlex split a string to multiple words.
+_shlex_special_re = re.compile(r"[\s'\"\\]")
+
+
 class Board:
     def __init__(self, config):
         self._config = config
 
-    @property
+    @cached_property
     def name(self):
         name = self._config.get("name")
         if name is None:
             name = "Unnamed {} board".format(self.codename or 'unknown')
         return name
 
-    @property
+    @cached_property
     def codename(self):
         return self._config.get("codename")
 
-    @property
+    @cached_property
+    def codename_parts(self):
+        if self.codename is None:
+            return ()
+
+        return tuple(self.codename.lower().replace('-', '_').split('_'))
+
+    @cached_property
     def arch(self):
         return Architecture(self._config.get("arch"))
 
-    @property
+    @cached_property
     def dt_compatible(self):
         pattern = self._config.get("dt-compatible")
 
         # Try to detect non-regex values and extend them to match any
         # rev/sku, but if a rev/sku is given match only the given one.
-        if pattern and re.fullmatch("[\w,-]+", pattern):
-            prefix, rev, sku = re.fullmatch(
-                "(.*?)(-rev\d+)?(-sku\d+)?",
-                pattern,
-            ).groups()
+        if pattern and _dt_simple_re.fullmatch(pattern):
+            prefix, rev, sku = _dt_split_re.fullmatch(pattern).groups()
 
             pattern = "{}{}{}".format(
                 prefix,
@@ -92,7 +109,7 @@ class Board:
         if pattern:
             return re.compile(pattern)
 
-    @property
+    @cached_property
     def hwid_match(self):
         pattern = self._config.get("hwid-match")
         if pattern in (None, "None", "none"):
@@ -101,37 +118,37 @@ class Board:
         if pattern:
             return re.compile(pattern)
 
-    @property
+    @cached_property
     def boots_lz4_kernel(self):
         return self._config.getboolean("boots-lz4-kernel", False)
 
-    @property
+    @cached_property
     def boots_lzma_kernel(self):
         return self._config.getboolean("boots-lzma-kernel", False)
 
-    @property
+    @cached_property
     def loads_zimage_ramdisk(self):
         return self._config.getboolean("loads-zimage-ramdisk", False)
 
-    @property
+    @cached_property
     def loads_fit_ramdisk(self):
         return self._config.getboolean("loads-fit-ramdisk", False)
 
-    @property
+    @cached_property
     def loads_dtb_off_by_one(self):
         return self._config.getboolean("loads-dtb-off-by-one", False)
 
-    @property
+    @cached_property
     def fit_ramdisk_load_address(self):
         addr = self._config.get("fit-ramdisk-load-address", None)
         return parse_bytesize(addr)
 
-    @property
+    @cached_property
     def image_start_address(self):
         addr = self._config.get("image-start-address", None)
         return parse_bytesize(addr)
 
-    @property
+    @cached_property
     def image_max_size(self):
         max_size = self._config.get("image-max-size")
         if max_size in (None, "None", "none"):
@@ -139,11 +156,41 @@ class Board:
 
         return parse_bytesize(max_size)
 
-    @property
+    @cached_property
     def image_format(self):
         return self._config.get("image-format")
 
 
+# Subcommands pass the same parser to each other, keep the boards built
+# from it on the parser itself so that they are only built once.
+def config_boards(parser):
+    boards = getattr(parser, "_depthchargectl_boards", None)
+    if boards is None:
+        boards = {
+            sectname: Board(section)
+            for sectname, section in parser.items()
+            if sectname.startswith("boards/")
+        }
+        parser._depthchargectl_boards = boards
+
+    return boards
+
+
+# Parsing the built-in configs is relatively slow, so do it once and
+# give out copies restored from a pickled snapshot of the result.
+@lru_cache(maxsize=1)
+def builtin_config():
+    parser = configparser.ConfigParser(
+        default_section="depthcharge-tools",
+        dict_type=ConfigDict,
+    )
+
+    parser.read_string(config_ini, source="config.ini")
+    parser.read_string(boards_ini, source="boards.ini")
+
+    return pickle.dumps(parser)
+
+
 class depthchargectl(
     Command,
     prog="depthchargectl",
@@ -228,14 +275,15 @@ class depthchargectl(
             self.logger.info(
                 "Defaulting to current system root '/'."
             )
-            return Path("/").resolve()
+            return _system_root
 
-        if os.path.ismount(Path(root).resolve()):
+        mnt = Path(root).resolve()
+        if os.path.ismount(mnt):
             self.logger.info(
                 "Using root argument '{}' as the system to work on."
                 .format(root)
             )
-            return Path(root).resolve()
+            return mnt
 
         if root in (None, "", "none", "None"):
             self.logger.info(
@@ -263,18 +311,16 @@ class depthchargectl(
             return mnt
 
         if self.root in ("", "None", "none", None):
-            return Path("/").resolve()
+            return _system_root
 
         if isinstance(self.root, Path):
             return self.root
 
         disk = self.diskinfo.evaluate(self.root)
-        mountpoints = sorted(
-            self.diskinfo.mountpoints(disk),
-            key=lambda p: len(p.parents),
-        )
+        mountpoints = self.diskinfo.mountpoints(disk)
 
         if len(mountpoints) > 1:
+            mountpoints = sorted(mountpoints, key=lambda p: len(p.parts))
             mnt = mountpoints[0]
             self.logger.warning(
                 "Choosing '{}' from multiple root mountpoints: {}."
@@ -283,8 +329,8 @@ class depthchargectl(
             return mnt
 
         elif mountpoints:
-            mnt = mountpoints[0]
-            if mnt != Path("/").resolve():
+            mnt, = mountpoints
+            if mnt != _system_root:
                 self.logger.info(
                     "Using root mountpoint '{}'."
                     .format(mnt)
@@ -295,7 +341,7 @@ class depthchargectl(
             "Couldn't find root mountpoint, falling back to '/'."
         )
 
-        return Path("/").resolve()
+        return _system_root
 
     @global_options.add
     @Argument("--boot-mountpoint", nargs=1, metavar="DIR")
@@ -311,10 +357,7 @@ class depthchargectl(
 
         boot_str = self.diskinfo.by_mountpoint("/boot", fstab_only=True)
         device = self.diskinfo.evaluate(boot_str)
-        mountpoints = sorted(
-            self.diskinfo.mountpoints(device),
-            key=lambda p: len(p.parents),
-        )
+        mountpoints = self.diskinfo.mountpoints(device)
 
         if device and not mountpoints:
             self.logger.warning(
@@ -323,13 +366,17 @@ class depthchargectl(
             )
 
         if len(mountpoints) > 1:
+            mountpoints = sorted(mountpoints, key=lambda p: len(p.parts))
+            mnt = mountpoints[0]
             self.logger.warning(
                 "Choosing '{}' from multiple /boot mountpoints: {}."
-                .format(mountpoints[0], ", ".join(str(m) for m in mountpoints))
+                .format(mnt, ", ".join(str(m) for m in mountpoints))
             )
+            return mnt
 
-        if mountpoints:
-            return mountpoints[0]
+        elif mountpoints:
+            mnt, = mountpoints
+            return mnt
 
         root = self.root_mountpoint
         boot = (root / "boot").resolve()
@@ -338,7 +385,7 @@ class depthchargectl(
             .format(boot)
         )
 
-        if root != Path("/").resolve() and not boot.is_dir():
+        if root != _system_root and not boot.is_dir():
             self.logger.warning(
                 "Boot mountpoint '{}' does not exist for custom root."
                 .format(boot)
@@ -352,10 +399,15 @@ class depthchargectl(
     @Argument(dest=argparse.SUPPRESS, help=argparse.SUPPRESS)
     def diskinfo(self):
         # Break cyclic dependencies here
-        yield Disks()
+        disks = Disks()
+        yield disks
 
         root = self.root_mountpoint
 
+        # The system disk info already uses the running system's files
+        if root == _system_root:
+            return disks
+
         return Disks(
             fstab=(root / "etc" / "fstab"),
             crypttab=(root / "etc" / "crypttab"),
@@ -414,13 +466,7 @@ class depthchargectl(
             file_ = None
 
         else:
-            parser = configparser.ConfigParser(
-                default_section="depthcharge-tools",
-                dict_type=ConfigDict,
-            )
-
-            parser.read_string(config_ini, source="config.ini")
-            parser.read_string(boards_ini, source="boards.ini")
+            parser = pickle.loads(builtin_config())
 
             try:
                 for p in parser.read(config_files):
@@ -436,18 +482,26 @@ class depthchargectl(
         boot = self.boot_mountpoint
 
         def fixup_path(f):
-            p = Path(f).resolve()
-            if f.startswith("/boot"):
+            p = Path(f)
+            if p.is_relative_to("/boot"):
                 return str(boot / p.relative_to("/boot"))
-            elif f.startswith("/"):
+            elif p.is_absolute():
                 return str(root / p.relative_to("/"))
 
-        if root != Path("/").resolve():
+        if root != _system_root:
             extra_parser = configparser.ConfigParser()
-            extra_files = [
-                *root.glob("etc/depthcharge-tools/config"),
-                *root.glob("etc/depthcharge-tools/config.d/*"),
-            ]
+            extra_files = []
+
+            config_f = root / "etc" / "depthcharge-tools" / "config"
+            if os.path.isfile(config_f):
+                extra_files.append(str(config_f))
+
+            try:
+                config_d = root / "etc" / "depthcharge-tools" / "config.d"
+                with os.scandir(config_d) as entries:
+                    extra_files.extend(e.path for e in entries if e.is_file())
+            except OSError:
+                pass
 
             try:
                 for p in extra_parser.read(extra_files):
@@ -511,58 +565,69 @@ class depthchargectl(
         elif codename is None:
             return None
 
-        boards = {
-            sectname: Board(section)
-            for sectname, section in self.config.parser.items()
-            if sectname.startswith("boards/")
-        }
-
         if not codename:
             codename = self.config.get("board", "")
 
         if codename in ("None", "none"):
             return None
 
-        elif codename:
+        boards = config_boards(self.config.parser)
+        candidates = (None, *boards.items())
+
+        if codename:
             parts = str(codename).lower().replace('-', '_').split('_')
+            parts_len = len(parts)
+
+            # Oldest boards have x86-alex_he etc.
+            matchable = {*parts, *(("amd64",) if "x86" in parts else ())}
+
+            # Don't match sections without explicit codenames
+            shadowed = set()
+            for sectname, board in boards.items():
+                parent, _, _ = sectname.rpartition('/')
+                if parent in boards and boards[parent].codename == board.codename:
+                    shadowed.add(sectname)
 
             def codename_match(item):
                 if item is None:
-                    return (len(parts) - 1, 0)
+                    return (parts_len - 1, 0)
 
                 sectname, board = item
-                matchparts = sectname.split("/") + (
-                    [] if board.codename is None else
-                    board.codename.lower().replace('-', '_').split('_')
-                )
+                if sectname in shadowed:
+                    return (parts_len - 1, float("inf"))
 
-                # Don't match sections without explicit codenames
-                parent, _, _ = sectname.rpartition('/')
-                if parent in boards and boards[parent].codename == board.codename:
-                    return (len(parts) - 1, float("inf"))
+                sect_parts = sectname.split("/")
+                matchparts = (*sect_parts, *board.codename_parts)
+
+                # Most boards share no parts with the codename at all
+                if matchable.isdisjoint(matchparts):
+                    return (parts_len - 1, len(sect_parts))
 
                 # Some kind of a fuzzy match, how many parts of the
                 # given codename exist in the parts of this config
-                idx = len(parts) - 1
-                while parts and matchparts and idx >= 0:
-                    if parts[idx] == matchparts[-1]:
+                idx = parts_len - 1
+                midx = len(matchparts) - 1
+                while idx >= 0 and midx >= 0:
+                    if parts[idx] == matchparts[midx]:
                         idx -= 1
-                    # Oldest boards have x86-alex_he etc.
-                    elif (parts[idx], matchparts[-1]) == ("x86", "amd64"):
+                    elif (parts[idx], matchparts[midx]) == ("x86", "amd64"):
                         idx -= 1
-                    matchparts.pop()
+                    midx -= 1
 
                 # Avoid matching only on "libreboot" without actual board
-                if parts[-1] == "libreboot" and idx == len(parts) - 2:
-                    return (len(parts) - 1, float("inf"))
+                if parts[-1] == "libreboot" and idx == parts_len - 2:
+                    return (parts_len - 1, float("inf"))
 
-                return (idx, len(sectname.split("/")))
+                return (idx, len(sect_parts))
 
-            match_groups = collections.defaultdict(list)
-            for item in (None, *boards.items()):
-                match_groups[codename_match(item)].append(item)
+            score, matches = None, []
+            for item in candidates:
+                item_score = codename_match(item)
+                if score is None or item_score < score:
+                    score, matches = item_score, [item]
+                elif item_score == score:
+                    matches.append(item)
 
-            score, matches = min(match_groups.items())
             if not matches or None in matches:
                 raise ValueError(
                     "Unknown board codename '{}'."
@@ -587,7 +652,8 @@ class depthchargectl(
         def hwid_match(item):
             sectname, board = item
             try:
-                return bool(re.match(board.hwid_match, hwid))
+                pattern = board.hwid_match
+                return bool(pattern and pattern.match(hwid))
             except:
                 return False
 
@@ -628,7 +694,7 @@ class depthchargectl(
                 return (float("inf"), -1)
 
         if compatibles is not None:
-            match = min((None, *boards.items()), key=compat_preference)
+            match = min(candidates, key=compat_preference)
         else:
             match = None
 
@@ -657,11 +723,11 @@ class depthchargectl(
         # Use generic boards per cpu architecture, since we couldn't
         # detect this system as a proper board
         arch = platform.machine()
-        if arch in Architecture.arm_32:
+        if str(arch) in Architecture.arm_32:
             sectname = "boards/arm"
-        elif arch in Architecture.arm_64:
+        elif str(arch) in Architecture.arm_64:
             sectname = "boards/arm64"
-        elif arch in Architecture.x86:
+        elif str(arch) in Architecture.x86:
             sectname = "boards/amd64"
         board = boards.get(sectname, None)
         if board is not None:
@@ -691,11 +757,11 @@ class depthchargectl(
         dir_ = Path(dir_).resolve()
 
         boot = self.boot_mountpoint
-        if boot != Path("/boot").resolve() and dir_.is_relative_to("/boot"):
+        if dir_.is_relative_to("/boot") and boot != Path("/boot").resolve():
             return boot / dir_.relative_to("/boot")
 
         root = self.root_mountpoint
-        if root != Path("/").resolve() and not dir_.is_relative_to(root):
+        if root != _system_root and not dir_.is_relative_to(root):
             return root / dir_.relative_to("/")
 
         return dir_
@@ -710,7 +776,7 @@ class depthchargectl(
                 return Path(keydir).resolve()
 
         root = self.root_mountpoint
-        if root != Path("/").resolve():
+        if root != _system_root:
             keydir = vboot_keys(root=root)[0]
             if keydir:
                 return Path(keydir).resolve()
@@ -792,7 +858,7 @@ class depthchargectl(
             cmdline_src = "/etc/kernel/cmdline"
 
         if len(cmds) == 0:
-            if self.root_mountpoint == Path("/").resolve():
+            if self.root_mountpoint == _system_root:
                 cmds = [
                     cmd for cmd in proc_cmdline()
                     if cmd.split("=", 1)[0] not in (
@@ -804,7 +870,11 @@ class depthchargectl(
 
         flat_cmds = []
         for cmd in cmds:
-            flat_cmds.extend(shlex.split(cmd))
+            # Most of these are already single words, skip shlex for them
+            if cmd and not _shlex_special_re.search(cmd):
+                flat_cmds.append(cmd)
+            else:
+                flat_cmds.extend(shlex.split(cmd))
 
         if flat_cmds:
             self.logger.info(
@@ -11,6 +11,7 @@ import configparser
 import logging
 import os
 import shlex
+import shutil
 import textwrap
 
 from pathlib import Path
@@ -29,10 +30,12 @@ from depthcharge_tools.utils.os import (
 )
 from depthcharge_tools.utils.pathlib import (
     copy,
+    iterfiles,
 )
 from depthcharge_tools.utils.platform import (
     KernelEntry,
     cpu_microcode,
+    dtb_compatibles,
     vboot_keys,
     installed_kernels,
     root_requires_initramfs,
@@ -41,7 +44,10 @@ from depthcharge_tools.utils.subprocess import (
     fdtget,
 )
 
-from depthcharge_tools.depthchargectl import depthchargectl
+from depthcharge_tools.depthchargectl import (
+    _system_root,
+    depthchargectl,
+)
 
 
 class SizeTooBigError(CommandExit):
@@ -62,6 +68,27 @@ class InitramfsSizeTooBigError(SizeTooBigError):
         )
 
 
+@lru_cache(maxsize=None)
+def dtb_compatibles_index(fdtdir):
+    index = collections.defaultdict(list)
+
+    for dt_file in iterfiles(fdtdir, ".dtb"):
+        try:
+            compats = dtb_compatibles(dt_file)
+        except:
+            compats = fdtget.get(
+                dt_file, "/", "compatible", default="",
+            ).split()
+
+        for compat in compats:
+            index[compat].append(dt_file)
+
+    return {
+        compat: tuple(dt_files)
+        for compat, dt_files in index.items()
+    }
+
+
 @depthchargectl.subcommand("build")
 class depthchargectl_build(
     depthchargectl,
@@ -92,7 +119,7 @@ class depthchargectl_build(
 
         kernel_arches = self.board.arch.kernel_arches
         for k in list(kernels):
-            if k.arch not in kernel_arches:
+            if str(k.arch) not in kernel_arches:
                 self.logger.info(
                     "Ignoring kernel '{}' incompatible with board arch."
                     .format(k.release or "(unknown)")
@@ -261,18 +288,15 @@ class depthchargectl_build(
                 .format(self.fdtdir, self.board.dt_compatible.pattern)
             )
 
-            def is_compatible(dt_file):
-                return any(
-                    self.board.dt_compatible.fullmatch(compat)
-                    for compat in fdtget.get(
-                        dt_file, "/", "compatible", default="",
-                    ).split()
-                )
-
-            files = list(filter(
-                is_compatible,
-                self.fdtdir.glob("**/*.dtb"),
-            ))
+            # Each compatible string only needs to be matched once
+            dt_compatible = self.board.dt_compatible
+            files = sorted({
+                dt_file
+                for compat, dt_files
+                in dtb_compatibles_index(self.fdtdir).items()
+                if dt_compatible.fullmatch(compat)
+                for dt_file in dt_files
+            })
 
             if len(files) == 0:
                 raise ValueError(
@@ -330,7 +354,7 @@ class depthchargectl_build(
                 )
                 return root
 
-            if mnt != Path("/").resolve():
+            if mnt != _system_root:
                 raise ValueError(
                     "Couldn't convert mountpoint '{}' to a root cmdline."
                     .format(mnt)
@@ -432,7 +456,7 @@ class depthchargectl_build(
             if self.board.image_format == "zimage":
                 compress = ["none"]
 
-        return sorted(set(compress), key=compress.index)
+        return list(dict.fromkeys(compress))
 
     @options.add
     @Argument("--timestamp", nargs=1)
@@ -445,13 +469,14 @@ class depthchargectl_build(
         # Initramfs date is bound to be later than vmlinuz date, so
         # prefer that if possible.
         if seconds is None:
+            stats = self.input_stats
             if self.initrd is not None:
                 seconds = max(
-                    int(initrd.stat().st_mtime)
+                    int(stats[initrd].st_mtime)
                     for initrd in self.initrd
                 )
             else:
-                seconds = int(self.kernel.stat().st_mtime)
+                seconds = int(stats[self.kernel].st_mtime)
 
         if seconds is None:
             self.logger.error(
@@ -461,20 +486,30 @@ class depthchargectl_build(
 
         return seconds
 
+    @Argument(dest=argparse.SUPPRESS, help=argparse.SUPPRESS)
+    def input_stats(self):
+        # Timestamp and size checks all need these, stat them only once
+        return {
+            f: f.stat()
+            for f in (self.kernel, *(self.initrd or ()))
+        }
+
     @options.add
     @Argument("-o", "--output", nargs=1)
     def output(self, path=None):
         """Output image to path instead of storing in images-dir"""
         if path is None:
             image_name = "{}.img".format(self.kernel_release or "default")
-            path = self.images_dir / image_name
+            return self.images_dir / image_name
 
         return Path(path)
 
     def __call__(self):
+        board = self.board
+
         self.logger.warning(
             "Building depthcharge image for board '{}' ('{}')."
-            .format(self.board.name, self.board.codename)
+            .format(board.name, board.codename)
         )
 
         self.logger.info(
@@ -494,12 +529,13 @@ class depthchargectl_build(
             os.environ["SOURCE_DATE_EPOCH"] = str(self.timestamp)
 
         # Error early if initramfs is absolutely too big to fit
+        stats = self.input_stats
         initrd_size = (
-            sum(initrd.stat().st_size for initrd in self.initrd)
+            sum(stats[initrd].st_size for initrd in self.initrd)
             if self.initrd is not None
             else 0
         )
-        if initrd_size >= self.board.image_max_size:
+        if initrd_size >= board.image_max_size:
             self.logger.error(
                 "Initramfs alone is larger than the maximum image size."
             )
@@ -509,19 +545,34 @@ class depthchargectl_build(
         # loading the chosen dtb, adding each file twice solves it.
         dtbs = (
             self.dtbs
-            if not self.board.loads_dtb_off_by_one else
+            if not board.loads_dtb_off_by_one else
             [dtb for dtb in self.dtbs for _ in (0, 1)]
         )
 
+        # Only the kernel gets compressed, so no compression type can
+        # make the image smaller than the initramfs and dtbs together.
+        dtb_sizes = {dtb: dtb.stat().st_size for dtb in self.dtbs}
+        dtbs_size = sum(dtb_sizes[dtb] for dtb in dtbs)
+        if initrd_size + dtbs_size >= board.image_max_size:
+            self.logger.error(
+                "Initramfs and dtbs are larger than the maximum image size."
+            )
+            # Same as the check after building, only blame the initramfs
+            # if the image would fit without it.
+            if stats[self.kernel].st_size + dtbs_size < board.image_max_size:
+                raise InitramfsSizeTooBigError()
+            else:
+                raise SizeTooBigError()
+
         # Skip compress="none" if inputs wouldn't fit max image size
         compress_list = self.compress
         inputs_size = sum([
-            self.kernel.stat().st_size,
+            stats[self.kernel].st_size,
             initrd_size,
-            *(dtb.stat().st_size for dtb in dtbs),
+            dtbs_size,
         ])
 
-        if inputs_size > self.board.image_max_size and "none" in compress_list:
+        if inputs_size > board.image_max_size and "none" in compress_list:
             self.logger.info(
                 "Inputs are too big, skipping uncompressed build."
             )
@@ -532,44 +583,49 @@ class depthchargectl_build(
 
         # Avoid passing format-specific options unrelated to board format
         image_format_opts = {
-            "image_format": self.board.image_format,
+            "image_format": board.image_format,
         }
 
-        if self.board.image_format == "fit":
+        if board.image_format == "fit":
             image_format_opts["name"] = self.description
-            image_format_opts["patch_dtbs"] = not self.board.loads_fit_ramdisk
+            image_format_opts["patch_dtbs"] = not board.loads_fit_ramdisk
 
-            if self.board.fit_ramdisk_load_address is not None:
+            if board.fit_ramdisk_load_address is not None:
                 image_format_opts["ramdisk_load_address"] = (
-                    self.board.fit_ramdisk_load_address
+                    board.fit_ramdisk_load_address
                 )
 
-        elif self.board.image_format == "zimage":
-            if not self.board.loads_zimage_ramdisk:
+        elif board.image_format == "zimage":
+            if not board.loads_zimage_ramdisk:
                 hack = self.zimage_initramfs_hack
                 image_format_opts["pad_vmlinuz"] = (hack == "pad-vmlinuz")
                 image_format_opts["set_init_size"] = (hack == "set-init-size")
 
+        # Only the compression changes between attempts
+        mkdepthcharge_opts = dict(
+            arch=board.arch,
+            cmdline=self.kernel_cmdline,
+            dtbs=dtbs,
+            **image_format_opts,
+            kernel_start=board.image_start_address,
+            initramfs=self.initrd,
+            keyblock=self.vboot_keyblock,
+            output=outtmp,
+            signprivate=self.vboot_private_key,
+            signpubkey=self.vboot_public_key,
+            vmlinuz=self.kernel,
+            verbosity=self.verbosity,
+        )
+
         for compress in compress_list:
             self.logger.info("Trying with compression '{}'.".format(compress))
             tmpdir = self.tmpdir / "mkdepthcharge-{}".format(compress)
 
             try:
                 mkdepthcharge(
-                    arch=self.board.arch,
-                    cmdline=self.kernel_cmdline,
                     compress=compress,
-                    dtbs=dtbs,
-                    **image_format_opts,
-                    kernel_start=self.board.image_start_address,
-                    initramfs=self.initrd,
-                    keyblock=self.vboot_keyblock,
-                    output=outtmp,
-                    signprivate=self.vboot_private_key,
-                    signpubkey=self.vboot_public_key,
-                    vmlinuz=self.kernel,
                     tmpdir=tmpdir,
-                    verbosity=self.verbosity,
+                    **mkdepthcharge_opts,
                 )
 
             except Exception as err:
@@ -577,7 +633,8 @@ class depthchargectl_build(
                     "Failed while creating depthcharge image.",
                 ) from err
 
-            if outtmp.stat().st_size < self.board.image_max_size:
+            image_size = outtmp.stat().st_size
+            if image_size < board.image_max_size:
                 break
 
             self.logger.warning(
@@ -585,10 +642,14 @@ class depthchargectl_build(
                 .format(compress)
             )
 
+            # Intermediate files include decompressed kernel and copies
+            # of the initramfs, don't keep them around in a tmpfs.
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
         else:
             # The necessary zimage padding might be too big, actually
             # check if reducing the initramfs would make things fit.
-            if outtmp.stat().st_size - initrd_size < self.board.image_max_size:
+            if image_size - initrd_size < board.image_max_size:
                 raise InitramfsSizeTooBigError()
             else:
                 raise SizeTooBigError()
@@ -137,54 +137,62 @@ class depthchargectl_check(
 
 
     def __call__(self):
+        board = self.board
+
         image = self.image
 
         self.logger.warning(
             "Verifying depthcharge image for board '{}' ('{}')."
-            .format(self.board.name, self.board.codename)
+            .format(board.name, board.codename)
         )
 
         self.logger.info("Checking if image fits into size limit.")
         image_size = image.stat().st_size
-        if image_size > self.board.image_max_size:
+        if image_size > board.image_max_size:
             raise SizeTooBigError(
                 image,
                 image_size,
-                self.board.image_max_size,
+                board.image_max_size,
             )
 
+        # Verifying with the public key checks everything a plain verify
+        # does, so only do the latter to tell apart why the former failed.
         self.logger.info("Checking depthcharge image validity.")
-        if vbutil_kernel(
-            "--verify", image,
-            check=False,
-        ).returncode != 0:
-            raise NotADepthchargeImageError(image)
-
         self.logger.info("Checking depthcharge image signatures.")
+        signed = None
         if self.vboot_public_key is not None:
-            if vbutil_kernel(
+            signed = vbutil_kernel(
                 "--verify", image,
                 "--signpubkey", self.vboot_public_key,
                 check=False,
-            ).returncode != 0:
-                raise VbootSignatureError(image)
+            ).returncode == 0
 
-        itb = self.tmpdir / "{}.itb".format(image.name)
-        vbutil_kernel(
-            "--get-vmlinuz", image,
-            "--vmlinuz-out", itb,
+        if not signed and vbutil_kernel(
+            "--verify", image,
             check=False,
-        )
+        ).returncode != 0:
+            raise NotADepthchargeImageError(image)
+
+        if signed is False:
+            raise VbootSignatureError(image)
+
+        if board.image_format == "fit":
+            # Only FIT images have anything left to check in the kernel
+            itb = self.tmpdir / "{}.itb".format(image.name)
+            vbutil_kernel(
+                "--get-vmlinuz", image,
+                "--vmlinuz-out", itb,
+                check=False,
+            )
 
-        if self.board.image_format == "fit":
             self.logger.info("Checking FIT image format.")
             nodes = fdtget.subnodes(itb)
             if "images" not in nodes and "configurations" not in nodes:
-                raise ImageFormatError(image, self.board.image_format)
+                raise ImageFormatError(image, board.image_format)
 
             def is_compatible(dt_file, conf_path):
                 return any(
-                    self.board.dt_compatible.fullmatch(compat)
+                    board.dt_compatible.fullmatch(compat)
                     for compat in fdtget.get(
                         dt_file, conf_path, "compatible", default="",
                     ).split()
@@ -206,7 +214,7 @@ class depthchargectl_check(
                     break
             else:
                 raise MissingDTBError(
-                    image, self.board.dt_compatible.pattern,
+                    image, board.dt_compatible.pattern,
                 )
 
         self.logger.warning(
@@ -254,9 +254,13 @@ class depthchargectl_target(
             )
 
         # Get the least-successful, least-priority, least-tries-left
-        # partition in that order of preference.
+        # partition in that order of preference. Each comparison would
+        # query cgpt for both sides, so query each partition only once.
         if good_partitions:
-            return min(good_partitions)
+            return min(
+                good_partitions,
+                key=CrosPartition._comparable_parts,
+            )
         else:
             return NoUsableCrosPartition()
 
@@ -353,7 +353,7 @@ class mkdepthcharge(
                 .format(arch)
             )
 
-        elif arch not in Architecture.all:
+        elif str(arch) not in Architecture.all:
             raise ValueError(
                 "Can't build images for unknown architecture '{}'"
                 .format(arch)
@@ -368,9 +368,9 @@ class mkdepthcharge(
 
         # Default to architecture-specific formats.
         if format_ is None:
-            if self.arch in Architecture.arm:
+            if str(self.arch) in Architecture.arm:
                 format_ = "fit"
-            elif self.arch in Architecture.x86:
+            elif str(self.arch) in Architecture.x86:
                 format_ = "zimage"
             self.logger.info("Assuming image format '{}'.".format(format_))
 
@@ -389,7 +389,7 @@ class mkdepthcharge(
         if addr is not None:
             return parse_bytesize(addr)
 
-        if self.arch in Architecture.x86:
+        if str(self.arch) in Architecture.x86:
             return 0x100000
 
     @options.add
@@ -517,7 +517,7 @@ class mkdepthcharge(
             keydirs += [self.signpubkey.parent]
 
         if None in (self.keyblock, self.signprivate, self.signpubkey):
-            for d in sorted(set(keydirs), key=keydirs.index):
+            for d in dict.fromkeys(keydirs):
                 self.logger.info(
                     "Searching '{}' for vboot keys."
                     .format(d)
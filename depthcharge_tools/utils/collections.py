@@ -175,22 +175,23 @@ class DirectedGraph:
     def ancestors(self, *nodes):
         nodes = set(nodes)
 
-        ancestors = self.parents(*nodes)
-        tmp = self.parents(*ancestors)
-        while tmp - ancestors:
-            ancestors.update(tmp)
-            tmp = self.parents(*ancestors)
+        # Only look up parents of newly found nodes each step
+        ancestors = set()
+        new = self.parents(*nodes)
+        while new:
+            ancestors.update(new)
+            new = self.parents(*new) - ancestors
 
         return ancestors
 
     def descendants(self, *nodes):
         nodes = set(nodes)
 
-        descendants = self.children(*nodes)
-        tmp = self.children(*descendants)
-        while tmp - descendants:
-            descendants.update(tmp)
-            tmp = self.children(*descendants)
+        descendants = set()
+        new = self.children(*nodes)
+        while new:
+            descendants.update(new)
+            new = self.children(*new) - descendants
 
         return descendants
 
@@ -204,10 +205,11 @@ class DirectedGraph:
 
         leaves = self.leaves()
         node_leaves = set()
+        seen = set()
         while nodes:
+            seen.update(nodes)
             node_leaves.update(nodes.intersection(leaves))
-            nodes.difference_update(node_leaves)
-            nodes = self.children(*nodes)
+            nodes = self.children(*(nodes - leaves)) - seen
 
         return node_leaves
 
@@ -220,11 +222,13 @@ class DirectedGraph:
             roots.difference_update(*self.__edges.values())
             return roots
 
+        # Walk up level by level, never revisiting a node
         roots = self.roots()
         node_roots = set()
+        seen = set()
         while nodes:
+            seen.update(nodes)
             node_roots.update(nodes.intersection(roots))
-            nodes.difference_update(node_roots)
-            nodes = self.parents(*nodes)
+            nodes = self.parents(*(nodes - roots)) - seen
 
         return node_roots
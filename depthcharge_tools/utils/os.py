@@ -15,7 +15,7 @@ from depthcharge_tools.utils.collections import (
     DirectedGraph,
 )
 from depthcharge_tools.utils.pathlib import (
-    iterdir,
+    listdir,
     read_lines,
 )
 from depthcharge_tools.utils.platform import (
@@ -26,6 +26,12 @@ from depthcharge_tools.utils.subprocess import (
 )
 
 
+_partno_suffix_re = re.compile("(.*[^0-9])([0-9]+)$")
+_major_minor_re = re.compile("[0-9]+:[0-9]+")
+_partname_p_re = re.compile("(.*[0-9])p([0-9]+)")
+_partname_re = re.compile("(.*[^0-9])([0-9]+)")
+
+
 class Disks(DirectedGraph):
     def __init__(
         self,
@@ -39,6 +45,9 @@ class Disks(DirectedGraph):
     ):
         super().__init__()
 
+        # Don't cache while the graph is incomplete
+        self._evaluate_cache = None
+
         self._sys = sys = Path(sys)
         self._dev = dev = Path(dev)
         self._fstab = fstab = Path(fstab)
@@ -47,19 +56,38 @@ class Disks(DirectedGraph):
         self._mountinfo = mountinfo = Path(mountinfo)
         self._crypttab = crypttab = Path(crypttab)
 
-        for sysdir in iterdir(sys / "class" / "block"):
-            for device in read_lines(sysdir / "dm" / "name"):
-                self.add_edge(dev / sysdir.name, dev / "mapper" / device)
+        # Kernel block device names don't depend on the rest of the
+        # graph, so evaluate each of them once instead of per edge.
+        blockdevs = {}
+        def blockdev(name):
+            if name not in blockdevs:
+                blockdevs[name] = self.evaluate(dev / name)
+            return blockdevs[name]
+
+        # List each device's sysfs directory once, and only look into
+        # the subdirectories it actually has.
+        for name in listdir(sys / "class" / "block"):
+            sysdir = sys / "class" / "block" / name
+            entries = listdir(sysdir)
+
+            if "dm" in entries:
+                for device in read_lines(sysdir / "dm" / "name"):
+                    self._add_edge(
+                        blockdev(name),
+                        self.evaluate(dev / "mapper" / device),
+                    )
 
-            for device in iterdir(sysdir / "slaves"):
-                self.add_edge(dev / device.name, dev / sysdir.name)
+            if "slaves" in entries:
+                for device in listdir(sysdir / "slaves"):
+                    self._add_edge(blockdev(device), blockdev(name))
 
-            for device in iterdir(sysdir / "holders"):
-                self.add_edge(dev / sysdir.name, dev / device.name)
+            if "holders" in entries:
+                for device in listdir(sysdir / "holders"):
+                    self._add_edge(blockdev(name), blockdev(device))
 
-            for device in iterdir(sysdir):
-                if device.name.startswith(sysdir.name):
-                    self.add_edge(dev / sysdir.name, dev / device.name)
+            for device in entries:
+                if device.startswith(name):
+                    self._add_edge(blockdev(name), blockdev(device))
 
         for line in read_lines(crypttab):
             if line and not line.startswith("#"):
@@ -119,11 +147,24 @@ class Disks(DirectedGraph):
         self._mtab_mounts = mtab_mounts
         self._mountinfo_mounts = mountinfo_mounts
         self._mounts = mounts
+        self._evaluate_cache = {}
 
     def __getitem__(self, key):
         return self.evaluate(key)
 
     def evaluate(self, device):
+        # Same devices are evaluated repeatedly while querying mounts,
+        # but results don't change once the graph is built.
+        cache = self._evaluate_cache
+        if cache is None:
+            return self._evaluate(device)
+
+        if device not in cache:
+            cache[device] = self._evaluate(device)
+
+        return cache[device]
+
+    def _evaluate(self, device):
         dev = self._dev
         sys = self._sys
 
@@ -179,14 +220,14 @@ class Disks(DirectedGraph):
 
             if partnroff:
                 device = device.resolve()
-                match = re.match("(.*[^0-9])([0-9]+)$", device.name)
+                match = _partno_suffix_re.match(device.name)
                 if not match:
                     return None
                 prefix, partno = match.groups()
                 partno = str(int(partno) + int(partnroff))
                 device = device.with_name("{}{}".format(prefix, partno))
 
-        elif re.match("[0-9]+:[0-9]+", device):
+        elif _major_minor_re.match(device):
             device = dev / "block" / device
 
         # Encrypted devices may currently be set up with names different
@@ -213,17 +254,18 @@ class Disks(DirectedGraph):
                     else:
                         device = str(parentdev)
 
+        # Resolve once here instead of in each constructor we try
         device = Path(device).resolve()
         if not device.exists() or dev not in device.parents:
             return None
 
         try:
-            return Partition(device, dev=dev, sys=sys)
+            return Partition(device, dev=dev, sys=sys, _resolved=True)
         except:
             pass
 
         try:
-            return Disk(device, dev=dev, sys=sys)
+            return Disk(device, dev=dev, sys=sys, _resolved=True)
         except:
             pass
 
@@ -308,8 +350,9 @@ class Disks(DirectedGraph):
                 return self.by_partuuid(rhs)
 
     def add_edge(self, node, child):
-        node = self.evaluate(node)
-        child = self.evaluate(child)
+        return self._add_edge(self.evaluate(node), self.evaluate(child))
+
+    def _add_edge(self, node, child):
         if node is not None and child is not None and node != child:
             return super().add_edge(node, child)
 
@@ -327,12 +370,14 @@ class Disks(DirectedGraph):
 
 
 class Disk:
-    def __init__(self, path, dev="/dev", sys="/sys"):
+    def __init__(self, path, dev="/dev", sys="/sys", _resolved=False):
         self._sys = sys = Path(sys)
         self._dev = dev = Path(dev)
 
         if isinstance(path, Disk):
             path = path.path
+        elif _resolved:
+            path = Path(path)
         else:
             path = Path(path).resolve()
 
@@ -388,7 +433,14 @@ class Disk:
 
 
 class Partition:
-    def __init__(self, path, partno=None, dev="/dev", sys="/sys"):
+    def __init__(
+        self,
+        path,
+        partno=None,
+        dev="/dev",
+        sys="/sys",
+        _resolved=False,
+    ):
         self._dev = dev = Path(dev)
         self._sys = sys = Path(sys)
 
@@ -399,6 +451,9 @@ class Partition:
             disk = path.disk
             partno = path.partno
             path = path.path
+        elif _resolved:
+            disk = None
+            path = Path(path)
         else:
             disk = None
             path = Path(path).resolve()
@@ -410,8 +465,8 @@ class Partition:
             and path.is_block_device()
         ):
             match = (
-                re.fullmatch("(.*[0-9])p([0-9]+)", path.name)
-                or re.fullmatch("(.*[^0-9])([0-9]+)", path.name)
+                _partname_p_re.fullmatch(path.name)
+                or _partname_re.fullmatch(path.name)
             )
             if match:
                 diskname, partno = match.groups()
@@ -419,7 +474,7 @@ class Partition:
                 disk = Disk(path.with_name(diskname), dev=dev, sys=sys)
 
         if disk is None:
-            disk = Disk(path, dev=dev, sys=sys)
+            disk = Disk(path, dev=dev, sys=sys, _resolved=True)
             path = None
 
         if partno is None:
@@ -593,7 +648,7 @@ class CrosPartition(Partition):
             flags["successful"],
             flags["priority"],
             flags["tries"],
-            self.size,
+            size,
         )
 
     def __lt__(self, other):
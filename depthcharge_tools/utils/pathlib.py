@@ -5,6 +5,7 @@
 # Copyright (C) 2020-2022 Alper Nebi Yasak <alpernebiyasak@gmail.com>
 # See COPYRIGHT and LICENSE files for full copyright information.
 
+import os
 import shutil
 import subprocess
 
@@ -20,6 +21,19 @@ from depthcharge_tools.utils.subprocess import (
     zstd,
 )
 
+# Leading bytes of what each decompressor accepts, to avoid running the
+# ones that can't possibly work. Legacy lzma files have no magic bytes,
+# so lzma always gets a try.
+_decompress_magic = {
+    gzip: (b"\x1f",),
+    zstd: (b"\x28\xb5\x2f\xfd",),
+    xz: (b"\xfd7zXZ\x00",),
+    lz4: (b"\x04\x22\x4d\x18", b"\x02\x21\x4c\x18"),
+    bzip2: (b"BZh",),
+    lzop: (b"\x89LZO\x00",),
+}
+
+
 def copy(src, dest):
     dest = shutil.copy2(src, dest)
     return Path(dest)
@@ -29,7 +43,20 @@ def decompress(src, dest=None, partial=False):
     if dest is not None:
         dest = Path(dest)
 
+    if isinstance(src, bytes):
+        head = src[:8]
+    else:
+        try:
+            with open(src, "rb") as f:
+                head = f.read(8)
+        except OSError:
+            head = None
+
     for runner in (gzip, zstd, xz, lz4, lzma, bzip2, lzop):
+        magic = _decompress_magic.get(runner, b"")
+        if head is not None and not head.startswith(magic):
+            continue
+
         try:
             return runner.decompress(src, dest)
 
@@ -58,11 +85,43 @@ def iterdir(path):
         return []
 
 
+def listdir(path):
+    try:
+        return os.listdir(path)
+    except:
+        return []
+
+
+def iterfiles(path, suffix=""):
+    # Like path.glob("**/*{suffix}"), but uses the file types from
+    # directory listings instead of stat()-ing every entry.
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+
+    subdirs = []
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            subdirs.append(entry.path)
+        elif entry.name.endswith(suffix) and entry.is_file():
+            yield Path(entry.path)
+
+    for subdir in subdirs:
+        yield from iterfiles(subdir, suffix)
+
+
+def read_text(path):
+    # Opening the file is enough of an existence check
+    try:
+        return Path(path).read_text()
+    except OSError:
+        return None
+
+
 def read_lines(path):
     try:
-        if path.is_file():
-            return path.read_text().splitlines()
-        else:
-            return []
+        return path.read_text().splitlines()
     except:
         return []
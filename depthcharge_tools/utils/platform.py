@@ -5,42 +5,97 @@
 # Copyright (C) 2020-2022 Alper Nebi Yasak <alpernebiyasak@gmail.com>
 # See COPYRIGHT and LICENSE files for full copyright information.
 
-import collections
+import fnmatch
+import functools
 import glob
 import platform
 import re
 import shlex
+import struct
 
 from pathlib import Path
 
 from depthcharge_tools.utils.pathlib import (
     decompress,
+    iterfiles,
+    listdir,
+    read_text,
 )
 from depthcharge_tools.utils.subprocess import (
     crossystem,
 )
 
 
+@functools.lru_cache(maxsize=1)
 def dt_compatibles():
-    dt_model = Path("/proc/device-tree/compatible")
-    if dt_model.exists():
-        return dt_model.read_text().strip("\x00").split("\x00")
+    compatible = read_text("/proc/device-tree/compatible")
+    if compatible is not None:
+        return tuple(compatible.strip("\x00").split("\x00"))
 
 
 def dt_model():
-    dt_model = Path("/proc/device-tree/model")
-    if dt_model.exists():
-        return dt_model.read_text().strip("\x00")
+    model = read_text("/proc/device-tree/model")
+    if model is not None:
+        return model.strip("\x00")
 
 
+def dtb_compatibles(dt_file):
+    # Read the root node's compatible property from a flattened
+    # device-tree binary without spawning an fdtget for every file.
+    data = Path(dt_file).read_bytes()
+
+    magic, _, off_struct, off_strings = struct.unpack_from(">4I", data)
+    if magic != 0xd00dfeed:
+        raise ValueError(
+            "File '{}' is not a device-tree binary."
+            .format(dt_file)
+        )
+
+    def align(offset):
+        return (offset + 3) & ~3
+
+    # FDT_BEGIN_NODE for the root node, followed by its (empty) name
+    token, = struct.unpack_from(">I", data, off_struct)
+    if token != 0x1:
+        raise ValueError(
+            "Device-tree binary '{}' has no root node."
+            .format(dt_file)
+        )
+    offset = align(data.index(b"\x00", off_struct + 4) + 1)
+
+    # Properties must come before any subnodes, so stop at the first
+    # token that isn't a FDT_PROP or FDT_NOP.
+    while True:
+        token, = struct.unpack_from(">I", data, offset)
+        offset += 4
+
+        if token == 0x4:
+            continue
+        elif token != 0x3:
+            return []
+
+        length, nameoff = struct.unpack_from(">2I", data, offset)
+        offset += 8
+
+        name_start = off_strings + nameoff
+        name = data[name_start:data.index(b"\x00", name_start)]
+        if name == b"compatible":
+            value = data[offset:offset + length]
+            return value.rstrip(b"\x00").decode().split("\x00")
+
+        offset = align(offset + length)
+
+
+@functools.lru_cache(maxsize=1)
 def cros_hwid():
-    hwid_file = Path("/proc/device-tree/firmware/chromeos/hardware-id")
-    if hwid_file.exists():
-        return hwid_file.read_text().strip("\x00")
+    hwid = read_text("/proc/device-tree/firmware/chromeos/hardware-id")
+    if hwid is not None:
+        return hwid.strip("\x00")
 
     for hwid_file in Path("/sys/bus/platform/devices").glob("GGL0001:*/HWID"):
-        if hwid_file.exists():
-            return hwid_file.read_text().strip()
+        hwid = read_text(hwid_file)
+        if hwid is not None:
+            return hwid.strip()
 
     # Try crossystem as a last resort
     try:
@@ -50,13 +105,14 @@ def cros_hwid():
 
 
 def cros_fwid():
-    fwid_file = Path("/proc/device-tree/firmware/chromeos/firmware-version")
-    if fwid_file.exists():
-        return fwid_file.read_text().strip("\x00")
+    fwid = read_text("/proc/device-tree/firmware/chromeos/firmware-version")
+    if fwid is not None:
+        return fwid.strip("\x00")
 
     for fwid_file in Path("/sys/bus/platform/devices").glob("GGL0001:*/FWID"):
-        if fwid_file.exists():
-            return fwid_file.read_text().strip()
+        fwid = read_text(fwid_file)
+        if fwid is not None:
+            return fwid.strip()
 
     # Try crossystem as a last resort
     try:
@@ -72,12 +128,12 @@ def os_release(root=None):
         root = "/"
     root = Path(root).resolve()
 
-    os_release_f = root / "etc" / "os-release"
-    if not os_release_f.exists():
-        os_release_f = root / "usr" / "lib" / "os-release"
+    text = read_text(root / "etc" / "os-release")
+    if text is None:
+        text = read_text(root / "usr" / "lib" / "os-release")
 
-    if os_release_f.exists():
-        for line in os_release_f.read_text().splitlines():
+    if text is not None:
+        for line in text.splitlines():
             lhs, _, rhs = line.partition("=")
             os_release[lhs] = rhs.strip('\'"')
 
@@ -91,12 +147,12 @@ def kernel_cmdline(root=None):
         root = "/"
     root = Path(root).resolve()
 
-    cmdline_f = root / "etc" / "kernel" / "cmdline"
-    if not cmdline_f.exists():
-        cmdline_f = root / "usr" / "lib" / "kernel" / "cmdline"
+    text = read_text(root / "etc" / "kernel" / "cmdline")
+    if text is None:
+        text = read_text(root / "usr" / "lib" / "kernel" / "cmdline")
 
-    if cmdline_f.exists():
-        cmdline = cmdline_f.read_text().rstrip("\n")
+    if text is not None:
+        cmdline = text.rstrip("\n")
 
     return shlex.split(cmdline)
 
@@ -104,13 +160,14 @@ def kernel_cmdline(root=None):
 def proc_cmdline():
     cmdline = ""
 
-    cmdline_f = Path("/proc/cmdline")
-    if cmdline_f.exists():
-        cmdline = cmdline_f.read_text().rstrip("\n")
+    text = read_text("/proc/cmdline")
+    if text is not None:
+        cmdline = text.rstrip("\n")
 
     return shlex.split(cmdline)
 
 
+@functools.lru_cache(maxsize=1)
 def is_cros_boot():
     dt_cros_firmware = Path("/proc/device-tree/firmware/chromeos")
     if dt_cros_firmware.is_dir():
@@ -131,7 +188,7 @@ def is_cros_libreboot():
     return fwid.lower().startswith("libreboot")
 
 
-def root_requires_initramfs(root):
+def _root_cmdline_pattern():
     x = "[0-9a-fA-F]"
     uuid = "{x}{{8}}-{x}{{4}}-{x}{{4}}-{x}{{4}}-{x}{{12}}".format(x=x)
     ntsig = "{x}{{8}}-{x}{{2}}".format(x=x)
@@ -139,9 +196,9 @@ def root_requires_initramfs(root):
     # Depthcharge replaces %U with an uuid, so we can use that as well.
     uuid = "({}|%U)".format(uuid)
 
-    # Tries to validate the root=* kernel cmdline parameter.
+    # Valid forms of the root=* kernel cmdline parameter.
     # See init/do_mounts.c in Linux tree.
-    for pat in (
+    return "|".join("(?:{})".format(pat) for pat in (
         "[0-9a-fA-F]{4}",
         "/dev/nfs",
         "/dev/[0-9a-zA-Z]+",
@@ -154,13 +211,19 @@ def root_requires_initramfs(root):
         "[0-9]+:[0-9]+",
         "PARTLABEL=.+",
         "/dev/cifs",
-    ):
-        if re.fullmatch(pat, root):
-            return False
+    ))
+
+
+_root_cmdline_re = re.compile(_root_cmdline_pattern())
 
-    return True
+
+@functools.lru_cache(maxsize=None)
+def root_requires_initramfs(root):
+    # Tries to validate the root=* kernel cmdline parameter.
+    return _root_cmdline_re.fullmatch(root) is None
 
 
+@functools.lru_cache(maxsize=None)
 def vboot_keys(*keydirs, system=True, root=None):
     if len(keydirs) == 0 or system:
         if root is None:
@@ -176,19 +239,20 @@ def vboot_keys(*keydirs, system=True, root=None):
 
     for keydir in keydirs:
         keydir = Path(keydir)
-        if not keydir.is_dir():
+
+        # One listing tells us which keys might be there, only stat()
+        # those to skip broken symlinks.
+        names = listdir(keydir)
+        if not names:
             continue
 
-        keyblock = keydir / "kernel.keyblock"
-        signprivate = keydir / "kernel_data_key.vbprivk"
-        signpubkey = keydir / "kernel_subkey.vbpubk"
+        def key(name):
+            if name in names and (keydir / name).exists():
+                return keydir / name
 
-        if not keyblock.exists():
-            keyblock = None
-        if not signprivate.exists():
-            signprivate = None
-        if not signpubkey.exists():
-            signpubkey = None
+        keyblock = key("kernel.keyblock")
+        signprivate = key("kernel_data_key.vbprivk")
+        signpubkey = key("kernel_subkey.vbpubk")
 
         if keyblock or signprivate or signpubkey:
             return keydir, keyblock, signprivate, signpubkey
@@ -227,11 +291,10 @@ def cpu_microcode(boot=None):
     return microcode
 
 
+# Kernels are scanned once per root and boot directory and the results
+# are kept for the lifetime of the process, commands don't install or
+# remove kernels while they run.
 def installed_kernels(root=None, boot=None):
-    kernels = {}
-    initrds = {}
-    fdtdirs = {}
-
     if root is None:
         root = "/"
     root = Path(root).resolve()
@@ -240,95 +303,125 @@ def installed_kernels(root=None, boot=None):
         boot = root / "boot"
     boot = Path(boot).resolve()
 
+    # Callers are free to modify the list we return
+    return list(_installed_kernels(root, boot))
+
+
+@functools.lru_cache(maxsize=None)
+def _installed_kernels(root, boot):
+    kernels = {}
+    initrds = {}
+    fdtdirs = {}
+
+    # Each boot.glob() would list /boot again, match names from a
+    # single listing of it instead.
+    boot_names = listdir(boot)
+
+    def boot_glob(pattern):
+        return [boot / name for name in fnmatch.filter(boot_names, pattern)]
+
+    # Likewise, list the per-release module directories only once
+    # for all the file names we look for in them.
+    module_releases = {
+        modules: listdir(root / modules)
+        for modules in ("lib/modules", "usr/lib/modules")
+    }
+
+    def modules_glob(modules, name):
+        return [
+            root / modules / release / name
+            for release in module_releases[modules]
+        ]
+
     for f in (
-        *root.glob("lib/modules/*/vmlinuz"),
-        *root.glob("lib/modules/*/vmlinux"),
-        *root.glob("lib/modules/*/Image"),
-        *root.glob("lib/modules/*/zImage"),
-        *root.glob("lib/modules/*/bzImage"),
-        *root.glob("usr/lib/modules/*/vmlinuz"),
-        *root.glob("usr/lib/modules/*/vmlinux"),
-        *root.glob("usr/lib/modules/*/Image"),
-        *root.glob("usr/lib/modules/*/zImage"),
-        *root.glob("usr/lib/modules/*/bzImage"),
+        *modules_glob("lib/modules", "vmlinuz"),
+        *modules_glob("lib/modules", "vmlinux"),
+        *modules_glob("lib/modules", "Image"),
+        *modules_glob("lib/modules", "zImage"),
+        *modules_glob("lib/modules", "bzImage"),
+        *modules_glob("usr/lib/modules", "vmlinuz"),
+        *modules_glob("usr/lib/modules", "vmlinux"),
+        *modules_glob("usr/lib/modules", "Image"),
+        *modules_glob("usr/lib/modules", "zImage"),
+        *modules_glob("usr/lib/modules", "bzImage"),
     ):
         if not f.is_file():
             continue
         release = f.parent.name
-        kernels[release] = f.resolve()
+        kernels[release] = f
 
     for f in (
-        *boot.glob("vmlinuz-*"),
-        *boot.glob("vmlinux-*"),
+        *boot_glob("vmlinuz-*"),
+        *boot_glob("vmlinux-*"),
     ):
         if not f.is_file():
             continue
         _, _, release = f.name.partition("-")
-        kernels[release] = f.resolve()
+        kernels[release] = f
 
     for f in (
-        *boot.glob("vmlinuz"),
-        *boot.glob("vmlinux"),
+        *boot_glob("vmlinuz"),
+        *boot_glob("vmlinux"),
         *root.glob("vmlinuz"),
         *root.glob("vmlinux"),
-        *boot.glob("Image"),
-        *boot.glob("zImage"),
-        *boot.glob("bzImage"),
+        *boot_glob("Image"),
+        *boot_glob("zImage"),
+        *boot_glob("bzImage"),
     ):
         if not f.is_file():
             continue
-        kernels[None] = f.resolve()
+        kernels[None] = f
         break
 
     for f in (
-        *root.glob("lib/modules/*/initrd"),
-        *root.glob("lib/modules/*/initramfs"),
-        *root.glob("lib/modules/*/initrd.img"),
-        *root.glob("lib/modules/*/initramfs.img"),
-        *root.glob("usr/lib/modules/*/initrd"),
-        *root.glob("usr/lib/modules/*/initramfs"),
-        *root.glob("usr/lib/modules/*/initrd.img"),
-        *root.glob("usr/lib/modules/*/initramfs.img"),
+        *modules_glob("lib/modules", "initrd"),
+        *modules_glob("lib/modules", "initramfs"),
+        *modules_glob("lib/modules", "initrd.img"),
+        *modules_glob("lib/modules", "initramfs.img"),
+        *modules_glob("usr/lib/modules", "initrd"),
+        *modules_glob("usr/lib/modules", "initramfs"),
+        *modules_glob("usr/lib/modules", "initrd.img"),
+        *modules_glob("usr/lib/modules", "initramfs.img"),
     ):
         if not f.is_file():
             continue
         release = f.parent.name
-        initrds[release] = f.resolve()
+        initrds[release] = f
 
     for f in (
-        *boot.glob("initrd-*.img"),
-        *boot.glob("initramfs-*.img"),
+        *boot_glob("initrd-*.img"),
+        *boot_glob("initramfs-*.img"),
     ):
         if not f.is_file():
             continue
         _, _, release = f.name.partition("-")
         release = release[:-4]
-        initrds[release] = f.resolve()
+        initrds[release] = f
 
     for f in (
-        *boot.glob("initrd-*"),
-        *boot.glob("initrd.img-*"),
-        *boot.glob("initramfs-*"),
-        *boot.glob("initramfs.img-*"),
+        *boot_glob("initrd-*"),
+        *boot_glob("initrd.img-*"),
+        *boot_glob("initramfs-*"),
+        *boot_glob("initramfs.img-*"),
     ):
         if not f.is_file():
             continue
         _, _, release = f.name.partition("-")
-        initrds[release] = f.resolve()
+        initrds[release] = f
 
     for f in (
-        *boot.glob("initrd.img"),
-        *boot.glob("initrd"),
-        *boot.glob("initramfs-linux.img"),
-        *boot.glob("initramfs-vanilla"),
-        *boot.glob("initramfs"),
+        *boot_glob("initrd.img"),
+        *boot_glob("initrd"),
+        *boot_glob("initramfs-linux.img"),
+        *boot_glob("initramfs-vanilla"),
+        *boot_glob("initramfs"),
         *root.glob("initrd.img"),
         *root.glob("initrd"),
         *root.glob("initramfs"),
     ):
         if not f.is_file():
             continue
-        initrds[None] = f.resolve()
+        initrds[None] = f
         break
 
     for d in (
@@ -337,27 +430,27 @@ def installed_kernels(root=None, boot=None):
         if not d.is_dir():
             continue
         _, _, release = d.name.partition("linux-image-")
-        fdtdirs[release] = d.resolve()
+        fdtdirs[release] = d
 
     for d in (
-        *root.glob("lib/modules/*/dtb"),
-        *root.glob("lib/modules/*/dtbs"),
-        *root.glob("usr/lib/modules/*/dtb"),
-        *root.glob("usr/lib/modules/*/dtbs"),
+        *modules_glob("lib/modules", "dtb"),
+        *modules_glob("lib/modules", "dtbs"),
+        *modules_glob("usr/lib/modules", "dtb"),
+        *modules_glob("usr/lib/modules", "dtbs"),
     ):
         if not d.is_dir():
             continue
         release = d.parent.name
-        fdtdirs[release] = d.resolve()
+        fdtdirs[release] = d
 
     for d in (
-        *boot.glob("dtb-*"),
-        *boot.glob("dtbs-*"),
+        *boot_glob("dtb-*"),
+        *boot_glob("dtbs-*"),
     ):
         if not d.is_dir():
             continue
         _, _, release = d.name.partition("-")
-        fdtdirs[release] = d.resolve()
+        fdtdirs[release] = d
 
     for d in (
         *boot.glob("dtb/*"),
@@ -366,11 +459,11 @@ def installed_kernels(root=None, boot=None):
         if not d.is_dir():
             continue
         if d.name in kernels:
-            fdtdirs[d.name] = d.resolve()
+            fdtdirs[d.name] = d
 
     for d in (
-        *boot.glob("dtbs"),
-        *boot.glob("dtb"),
+        *boot_glob("dtbs"),
+        *boot_glob("dtb"),
         *root.glob("usr/share/dtbs"),
         *root.glob("usr/share/dtb"),
     ):
@@ -378,12 +471,24 @@ def installed_kernels(root=None, boot=None):
             continue
         # Duplicate dtb files means that the directory is split by
         # kernel release and we can't use it for a single release.
-        dtbs = d.glob("**/*.dtb")
-        counts = collections.Counter(dtb.name for dtb in dtbs)
-        if all(c <= 1 for c in counts.values()):
-            fdtdirs[None] = d.resolve()
+        # The first duplicate is enough to tell, no need to walk the
+        # rest of the tree.
+        names = set()
+        for dtb in iterfiles(d, ".dtb"):
+            if dtb.name in names:
+                break
+            names.add(dtb.name)
+        else:
+            fdtdirs[None] = d
             break
 
+    # Later matches override earlier ones, so only resolve the paths
+    # that are actually kept. Symlinks need to be resolved to match
+    # the unversioned files to the versioned ones below.
+    kernels = {r: k.resolve() for r, k in kernels.items()}
+    initrds = {r: i.resolve() for r, i in initrds.items()}
+    fdtdirs = {r: d.resolve() for r, d in fdtdirs.items()}
+
     if None in kernels:
         kernel, release = kernels[None], None
         for r, k in kernels.items():
@@ -400,15 +505,24 @@ def installed_kernels(root=None, boot=None):
                 fdtdirs.setdefault(release, fdtdirs[None])
                 del fdtdirs[None]
 
-    return [
+    os_name = os_release(root=root).get("NAME", None)
+
+    return tuple(
         KernelEntry(
             release,
             kernel=kernels[release],
             initrd=initrds.get(release, None),
             fdtdir=fdtdirs.get(release, None),
-            os_name=os_release(root=root).get("NAME", None),
+            os_name=os_name,
         ) for release in kernels.keys()
-    ]
+    )
+
+
+# Rescan after installing or removing kernels
+installed_kernels.cache_clear = _installed_kernels.cache_clear
+
+
+_release_parts_re = re.compile("([^a-zA-Z0-9]?)([a-zA-Z]*)([0-9]*)")
 
 
 class KernelEntry:
@@ -444,14 +558,14 @@ class KernelEntry:
         elif head[0x34:0x38] == b"\x45\x45\x45\x45":
             return Architecture("arm")
 
+    # Kernels get sorted a lot, only parse each release once
+    @functools.cached_property
     def _comparable_parts(self):
-        pattern = "([^a-zA-Z0-9]?)([a-zA-Z]*)([0-9]*)"
-
         if self.release is None:
             return ()
 
         parts = []
-        for sep, text, num in re.findall(pattern, self.release):
+        for sep, text, num in _release_parts_re.findall(self.release):
             # x.y.z > x.y-* == x.y* > x.y~*
             sep = {
                 "~": -1,
@@ -475,13 +589,13 @@ class KernelEntry:
         if not isinstance(other, KernelEntry):
             return NotImplemented
 
-        return self._comparable_parts() < other._comparable_parts()
+        return self._comparable_parts < other._comparable_parts
 
     def __gt__(self, other):
         if not isinstance(other, KernelEntry):
             return NotImplemented
 
-        return self._comparable_parts() > other._comparable_parts()
+        return self._comparable_parts > other._comparable_parts
 
     def __str__(self):
         return self.description
@@ -494,58 +608,72 @@ class KernelEntry:
 
 
 class Architecture(str):
-    arm_32 = ["arm", "ARM", "armv7", "ARMv7", ]
-    arm_64 = ["arm64", "ARM64", "aarch64", "AArch64"]
-    arm = arm_32 + arm_64
-    x86_32 = ["i386", "x86"]
-    x86_64 = ["x86_64", "amd64", "AMD64"]
-    x86 = x86_32 + x86_64
-    all = arm + x86
+    arm_32 = frozenset(["arm", "ARM", "armv7", "ARMv7", ])
+    arm_64 = frozenset(["arm64", "ARM64", "aarch64", "AArch64"])
+    arm = arm_32 | arm_64
+    x86_32 = frozenset(["i386", "x86"])
+    x86_64 = frozenset(["x86_64", "amd64", "AMD64"])
+    x86 = x86_32 | x86_64
+    all = arm | x86
     groups = (arm_32, arm_64, x86_32, x86_64)
 
+    # Instances are just the name, don't give each one a __dict__
+    __slots__ = ()
+
+    # Which group each name belongs to, to avoid scanning all groups.
+    # Equality spans groups so instances can't be hashed, look up the
+    # plain names in these sets and dicts instead.
+    _group_of = {name: group for group in groups for name in group}
+
+    _mkimage_names = {
+        arm_32: "arm",
+        arm_64: "arm64",
+        x86_32: "x86",
+        x86_64: "x86_64",
+    }
+
+    _vboot_names = {
+        arm_32: "arm",
+        arm_64: "aarch64",
+        x86_32: "x86",
+        x86_64: "amd64",
+    }
+
+    _kernel_arches = {
+        arm_32: arm_32,
+        arm_64: arm,
+        x86_32: x86_32,
+        x86_64: x86,
+    }
+
     def __eq__(self, other):
+        if str.__eq__(self, other) is True:
+            return True
+
         if isinstance(other, Architecture):
-            for group in self.groups:
-                if self in group and other in group:
-                    return True
+            group = self._group_of.get(str(self))
+            if group is not None and str(other) in group:
+                return True
         return str(self) == str(other)
 
     def __ne__(self, other):
+        if str.__eq__(self, other) is True:
+            return False
+
         if isinstance(other, Architecture):
-            for group in self.groups:
-                if self in group and other not in group:
-                    return True
+            group = self._group_of.get(str(self))
+            if group is not None and str(other) not in group:
+                return True
         return str(self) != str(other)
 
     @property
     def mkimage(self):
-        if self in self.arm_32:
-            return "arm"
-        if self in self.arm_64:
-            return "arm64"
-        if self in self.x86_32:
-            return "x86"
-        if self in self.x86_64:
-            return "x86_64"
+        return self._mkimage_names.get(self._group_of.get(str(self)))
 
     @property
     def vboot(self):
-        if self in self.arm_32:
-            return "arm"
-        if self in self.arm_64:
-            return "aarch64"
-        if self in self.x86_32:
-            return "x86"
-        if self in self.x86_64:
-            return "amd64"
+        return self._vboot_names.get(self._group_of.get(str(self)))
 
     @property
     def kernel_arches(self):
-        if self in self.arm_32:
-            return self.arm_32
-        if self in self.arm_64:
-            return self.arm
-        if self in self.x86_32:
-            return self.x86_32
-        if self in self.x86_64:
-            return self.x86
+        return self._kernel_arches.get(self._group_of.get(str(self)))
@@ -39,6 +39,7 @@ def bytesize_suffixes():
             yield (suffix.strip(), int(size))
 
 bytesize_suffixes = dict(bytesize_suffixes())
+_bytesize_suffix_re = re.compile(r"[a-zA-Z\s]*\Z")
 
 
 def parse_bytesize(val):
@@ -50,6 +51,12 @@ def parse_bytesize(val):
     except:
         pass
 
+    # Handles 0x, 0o, 0b prefixes without invoking the Python parser
+    try:
+        return int(val, 0)
+    except:
+        pass
+
     try:
         return int(ast.literal_eval(val))
     except:
@@ -57,10 +64,13 @@ def parse_bytesize(val):
 
     try:
         s = str(val)
-        suffix = re.search("[a-zA-Z\s]*\Z", s)[0].strip()
+        suffix = _bytesize_suffix_re.search(s)[0].strip()
         number = s.rpartition(suffix)[0].strip()
         multiplier = bytesize_suffixes[suffix]
-        return int(ast.literal_eval(number)) * multiplier
+        try:
+            return int(number, 0) * multiplier
+        except ValueError:
+            return int(ast.literal_eval(number)) * multiplier
 
     except Exception as err:
         raise ValueError(
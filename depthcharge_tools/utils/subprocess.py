@@ -6,13 +6,21 @@
 # See COPYRIGHT and LICENSE files for full copyright information.
 
 import contextlib
+import gzip as _gzip
 import logging
 import re
 import subprocess
 import shlex
+import zlib
 
 from pathlib import Path
 
+# Python can be built without liblzma, use the lzma program then
+try:
+    import lzma as _lzma
+except ImportError:
+    _lzma = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -77,6 +85,24 @@ class ProcessRunner:
         return err
 
 
+# Runners decompress well-formed inputs in-process, and leave anything
+# else to the programs so that errors and partial outputs stay the same.
+def _read_input(src):
+    if isinstance(src, bytes):
+        return src
+    return Path(src).read_bytes()
+
+
+def _write_output(data, dest):
+    if dest is None:
+        return data
+
+    dest = Path(dest)
+    with dest.open("xb") as f:
+        f.write(data)
+    return dest
+
+
 class GzipRunner(ProcessRunner):
     def __init__(self):
         super().__init__("gzip", encoding=None)
@@ -90,6 +116,14 @@ class GzipRunner(ProcessRunner):
             return Path(dest)
 
     def decompress(self, src, dest=None):
+        # This raises on trailing garbage just like gzip errors out
+        try:
+            data = _gzip.decompress(_read_input(src))
+        except (OSError, EOFError, zlib.error):
+            pass
+        else:
+            return _write_output(data, dest)
+
         proc = self("-c", "-d", stdin=src, stdout=dest)
 
         if dest is None:
@@ -132,6 +166,14 @@ class LzmaRunner(ProcessRunner):
         super().__init__("lzma", encoding=None)
 
     def compress(self, src, dest=None):
+        if _lzma is not None:
+            # Same liblzma encoder and defaults as the lzma program uses
+            data = _lzma.compress(
+                _read_input(src),
+                format=_lzma.FORMAT_ALONE,
+            )
+            return _write_output(data, dest)
+
         proc = self("-z", stdin=src, stdout=dest)
 
         if dest is None:
@@ -140,6 +182,18 @@ class LzmaRunner(ProcessRunner):
             return Path(dest)
 
     def decompress(self, src, dest=None):
+        if _lzma is not None:
+            # Unlike the lzma program, this ignores trailing data after
+            # the end of the stream, so check for that ourselves.
+            decomp = _lzma.LZMADecompressor(format=_lzma.FORMAT_ALONE)
+            try:
+                data = decomp.decompress(_read_input(src))
+            except (OSError, _lzma.LZMAError):
+                pass
+            else:
+                if decomp.eof and not decomp.unused_data:
+                    return _write_output(data, dest)
+
         proc = self("-d", stdin=src, stdout=dest)
 
         if dest is None:
@@ -433,8 +487,6 @@ class FdtgetRunner(ProcessRunner):
 
     def subnodes(self, dt_file, node='/'):
         proc = self("--list", str(dt_file), str(node), check=False)
-        nodes = proc.stdout.splitlines()
-
         if proc.returncode == 0:
             return proc.stdout.splitlines()
         else: